@@ -3,21 +3,48 @@
 # 🏆 STATUS: TRACEABLE | IDEMPOTENT | PRIORITIZED | ROBUST
 # ==========================================================
 
-import os, json, datetime, sys, time, random
+import os, json, datetime, io, sys, time, random, re
 import pytz, requests
+import numpy as np
 import pandas as pd
-import pandas_ta as ta
 import yfinance as yf
 import gspread
 from google.oauth2.service_account import Credentials
 from requests.adapters import HTTPAdapter
 from urllib3.util.retry import Retry
 
+# Fast JSON (orjson when installed; stdlib fallback). Both work on bytes.
+try:
+    import orjson
+    _json_loads, _json_dumps = orjson.loads, orjson.dumps
+except ImportError:
+    _json_loads = json.loads
+    def _json_dumps(obj): return json.dumps(obj).encode()
+
+import fast_ta
+
 # ==========================================================
 # ⚙️ CONFIGURATION
 # ==========================================================
 IST = pytz.timezone("Asia/Kolkata")
 SIGNAL_FILE = "diamond_signal.json"
+SHEETS_KEYS_FILE = "diamond_sheets_keys.json"  # <--- Local mirror of Sheets idempotency keys
+HISTORY_TAB = "history"                        # <--- Sheets tab for execution rows
+OHLC_CACHE  = "ohlc_cache.parquet"             # <--- Daily bars, (symbol, date) long format
+
+# Cached symbols whose last bar is this recent only fetch the trailing 5 sessions
+WARM_CACHE_DAYS = 4
+# Re-fetched closed bars drifting more than this vs cache = back-adjusted (split/dividend)
+ADJ_TOLERANCE = 0.002
+
+# Telegram HTML tags stripped for the console copy (one regex pass)
+_TAG_RE = re.compile(r"</?(?:b|i|code)>")
+
+# yfinance field labels -> canonical OHLC labels (static map, no per-column str work)
+_OHLC_RENAME = {
+    "open": "Open", "high": "High", "low": "Low", "close": "Close",
+    "adj close": "Adj Close", "volume": "Volume"
+}
 
 # [DOCS] Execution sanity only; Deep analysis guaranteed upstream (v17).
 MIN_BARS_REQUIRED = 50 
@@ -33,6 +60,9 @@ USER_AGENTS = [
     "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/17.2 Safari/605.1.15"
 ]
 
+# In-process memo for file-backed state: main.py re-runs main() every heartbeat
+_MEMO = {}
+
 # ==========================================================
 # 🛠️ UTILITIES
 # ==========================================================
@@ -42,37 +72,92 @@ def generate_run_id():
     """Generates a unique Trace ID for this execution instance."""
     return ist_now().strftime("%Y%m%d_%H%M")
 
+def rank_by_score(items, top=None):
+    """
+    Orders dicts by "score" (desc, stable) with one argsort over a float buffer.
+    With `top`, the first k of that order (ties keep input order, so no argpartition).
+    """
+    if not items: return []
+    scores = np.fromiter((x["score"] for x in items), dtype=np.float64, count=len(items))
+    order = np.argsort(-scores, kind="stable")[:top]
+    return [items[i] for i in order]
+
+def create_session():
+    """Keep-alive session for Telegram (reused across heartbeats)."""
+    s = requests.Session()
+    # sendMessage is not idempotent: retry only on 429 (Retry-After honoured) and never
+    # after a read timeout or 5xx, when the first POST may already have been delivered.
+    retries = Retry(total=2, read=0, backoff_factor=0.3, status_forcelist=[429],
+                    allowed_methods=frozenset({"POST"}))
+    s.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=4, max_retries=retries))
+    return s
+
+_TG_SESSION = create_session()
+
 def send_msg(text):
     if not TELEGRAM_TOKEN or not CHAT_ID:
         print(f"\n📢 [Telegram]\n{text}\n")
         return
     try:
         url = f"https://api.telegram.org/bot{TELEGRAM_TOKEN}/sendMessage"
-        requests.post(url, data={"chat_id": CHAT_ID, "text": text[:4000], "parse_mode": "HTML"}, timeout=10)
+        _TG_SESSION.post(url, data={"chat_id": CHAT_ID, "text": text[:4000], "parse_mode": "HTML"}, timeout=10)
     except: pass
 
-def check_sheets_idempotency(rows_to_add, worksheet):
+def load_sheets_keys():
+    """
+    Loads the local key mirror: {last_row: last synced sheet row, keys: set(), dirty: bool}.
+    Read from disk once per process; later heartbeats reuse the in-memory copy.
+    """
+    if "sheets_keys" in _MEMO: return _MEMO["sheets_keys"]
+
+    key_cache = {"last_row": 1, "keys": set(), "dirty": False} # Row 1 = header
+    if os.path.exists(SHEETS_KEYS_FILE):
+        try:
+            with open(SHEETS_KEYS_FILE, "rb") as f: data = _json_loads(f.read())
+            key_cache["last_row"] = data.get("last_row", 1)
+            key_cache["keys"] = {tuple(k) for k in data.get("keys", [])}
+        except Exception as e:
+            print(f"⚠️ Sheets Key Cache Unreadable: {e}. Rebuilding.")
+    _MEMO["sheets_keys"] = key_cache
+    return key_cache
+
+def save_sheets_keys(key_cache):
+    """Single flush per run, and only when something changed."""
+    if not key_cache["dirty"]: return
+    try:
+        with open(SHEETS_KEYS_FILE, "wb") as f:
+            f.write(_json_dumps({"last_row": key_cache["last_row"], "keys": sorted(key_cache["keys"])}))
+        key_cache["dirty"] = False
+    except Exception as e:
+        print(f"⚠️ Sheets Key Cache Write Failed: {e}")
+
+def check_sheets_idempotency(rows_to_add, spreadsheet, key_cache):
     """
     Prevents duplicates within the same Run ID.
-    Key: Date | Symbol | RunID
+    Key: (Date, Symbol, RunID)
     Allows multiple runs per day, but blocks retry duplicates.
+    Only rows appended since the last sync are read (cols A:B + J, one call).
     """
     try:
-        existing_data = worksheet.get_all_values()
-        existing_set = set()
-        
-        # Skip header row
-        for row in existing_data[1:]:
-            if len(row) >= 10: # Ensure row has RunID column
-                # Key: "YYYY-MM-DD|SYMBOL|RUN_ID"
-                key = f"{row[0]}|{row[1]}|{row[-1]}"
-                existing_set.add(key)
+        start = key_cache["last_row"] + 1
+        ranges = spreadsheet.values_batch_get(
+            [f"{HISTORY_TAB}!A{start}:B", f"{HISTORY_TAB}!J{start}:J"]
+        )["valueRanges"]
+        date_sym, run_ids = (r.get("values", []) for r in ranges)
+
+        # Key: (YYYY-MM-DD, SYMBOL, RUN_ID); rows without a RunID are ignored
+        key_cache["keys"].update(
+            (row[0], row[1], run[0]) for row, run in zip(date_sym, run_ids) if len(row) >= 2 and run
+        )
+        synced = max(len(date_sym), len(run_ids))
+        if synced:
+            key_cache["last_row"] += synced
+            key_cache["dirty"] = True
         
+        existing_set = key_cache["keys"]
         unique_rows = []
         for row in rows_to_add:
-            # Key: "YYYY-MM-DD|SYMBOL|RUN_ID"
-            key = f"{row[0]}|{row[1]}|{row[-1]}"
-            if key not in existing_set:
+            if (row[0], row[1], row[-1]) not in existing_set:
                 unique_rows.append(row)
             else:
                 print(f"🔄 Skipping Duplicate (Replay Safety): {row[1]} | {row[-1]}")
@@ -91,7 +176,13 @@ def load_signal():
         return None, None
         
     try:
-        with open(SIGNAL_FILE, "r") as f: data = json.load(f)
+        # v17 rewrites the contract once a day (atomic rename -> new mtime);
+        # intraday heartbeats reuse the parsed copy.
+        mtime = os.stat(SIGNAL_FILE).st_mtime_ns
+        memo = _MEMO.get("signal")
+        if memo and memo[0] == mtime: return memo[1]
+
+        with open(SIGNAL_FILE, "rb") as f: data = _json_loads(f.read())
         meta = data.get("meta", {})
         universe = data.get("universe", [])
         
@@ -108,8 +199,9 @@ def load_signal():
             valid_universe.append(u)
         
         # Pre-Sort Universe by Score (Optimization)
-        valid_universe.sort(key=lambda x: x["score"], reverse=True)
+        valid_universe = rank_by_score(valid_universe)
             
+        _MEMO["signal"] = (mtime, (meta, valid_universe))
         return meta, valid_universe
         
     except Exception as e:
@@ -117,28 +209,136 @@ def load_signal():
         return None, None
 
 # ==========================================================
-# 🧠 EXECUTION REFINEMENT
+# 📦 PRICE CACHE (PARQUET)
 # ==========================================================
-def refine_trade(df):
-    if len(df) < MIN_BARS_REQUIRED: return None
+def load_ohlc_cache():
+    if not os.path.exists(OHLC_CACHE): return pd.DataFrame()
+    try: return pd.read_parquet(OHLC_CACHE)
+    except Exception as e:
+        print(f"⚠️ OHLC Cache Unreadable: {e}. Full download.")
+        return pd.DataFrame()
 
-    close, high, low = df["Close"], df["High"], df["Low"]
-    live_price = float(close.iloc[-1])
-    
+def save_ohlc_cache(bars):
+    """Atomic Write: temp -> replace (Crash-Safe)."""
+    temp_file = f"{OHLC_CACHE}.tmp"
     try:
-        ema50 = ta.ema(close, 50).iloc[-1]
-        atr = ta.atr(high, low, close, 14).iloc[-1]
-    except: return None
-
-    if pd.isna(atr) or atr <= 0: return None
-
-    # Trend Sanity Check
-    if live_price < ema50: return None
-
-    sl = round(live_price - (2.0 * atr), 1)
-    tgt = round(live_price + (3.5 * atr), 1)
+        bars.to_parquet(temp_file, engine="pyarrow", compression="zstd")
+        os.replace(temp_file, OHLC_CACHE)
+    except Exception as e:
+        print(f"⚠️ OHLC Cache Write Failed: {e}")
+
+def download_bars(tickers, period):
+    """yf.download -> long frame indexed by (symbol, date)."""
+    hist = yf.download(tickers, period=period, group_by="ticker", threads=True, progress=False)
+    if hist.empty: return pd.DataFrame()
+    if not isinstance(hist.columns, pd.MultiIndex):
+        if len(tickers) != 1: return pd.DataFrame()
+        hist = pd.concat({tickers[0]: hist}, axis=1)
+    if hist.index.tz is not None: hist.index = hist.index.tz_localize(None)
+
+    present = hist.columns.get_level_values(0).unique()
+    bars = pd.concat({tk: hist[tk] for tk in present}, names=["symbol", "date"])
+    return bars.rename(columns=_OHLC_RENAME).dropna(how="all")
+
+def adjusted_tickers(cache, recent, last_bar):
+    """Warm tickers whose settled bars in `recent` no longer match the cache (Yahoo back-adjusted)."""
+    # Each ticker's last cached bar may be an intraday partial (pre-close heartbeat):
+    # only bars strictly before it are settled in the cache and safe to compare.
+    idx = recent.index
+    settled = idx.get_level_values("date") < last_bar.reindex(idx.get_level_values("symbol")).to_numpy()
+    # v16 bars carry yfinance's Title-case labels (see _OHLC_RENAME)
+    closed = recent.loc[settled, "Close"]
+    cached = cache["Close"].reindex(closed.index)
+    drift = ((closed - cached).abs() / cached).groupby(level="symbol").max()
+    return drift[drift > ADJ_TOLERANCE].index.tolist()
+
+def fetch_history(symbols):
+    """
+    1y of daily bars as a (ticker, field) wide frame, served from the parquet cache.
+    Warm tickers only re-fetch the last 5 sessions (which also refreshes today's
+    partial bar); cold tickers fetch the full year. A split/dividend back-adjusts
+    Yahoo's whole history, so a warm ticker whose overlapping closed bars moved
+    is dropped from the cache and fetched cold.
+    """
+    tickers = [f"{s}.NS" for s in symbols]
+    today = pd.Timestamp(ist_now().date())
+    cache = load_ohlc_cache()
+
+    warm = set()
+    if not cache.empty:
+        last_bar = cache.reset_index("date")["date"].groupby(level="symbol").max()
+        warm = set(last_bar[last_bar >= today - pd.Timedelta(days=WARM_CACHE_DAYS)].index)
+    cold = [tk for tk in tickers if tk not in warm]
+    warm = [tk for tk in tickers if tk in warm]
+    print(f"📦 OHLC Cache: {len(warm)} warm | {len(cold)} cold")
+
+    fresh = []
+    if warm:
+        recent = download_bars(warm, "5d")
+        redo = adjusted_tickers(cache, recent, last_bar) if not recent.empty else []
+        if redo:
+            print(f"🔁 Back-adjusted history for {len(redo)} tickers. Re-fetching 1y...")
+            cache  = cache[~cache.index.get_level_values("symbol").isin(redo)]
+            recent = recent[~recent.index.get_level_values("symbol").isin(redo)]
+            cold  += redo
+        fresh.append(recent)
+    if cold: fresh.append(download_bars(cold, "1y"))
+    fresh = [f for f in fresh if not f.empty]
+
+    bars = pd.concat([cache] + fresh) if fresh else cache
+    if bars.empty: return pd.DataFrame()
+    if fresh:
+        # Fresh rows win (today's bar is partial intraday); keep a rolling 1y window
+        bars = bars[~bars.index.duplicated(keep="last")].sort_index()
+        bars = bars[bars.index.get_level_values("date") >= today - pd.DateOffset(years=1)]
+        save_ohlc_cache(bars)
+
+    bars = bars[bars.index.get_level_values("symbol").isin(tickers)]
+    return bars.unstack("symbol").swaplevel(axis=1).sort_index(axis=1)
 
-    return live_price, sl, tgt
+# ==========================================================
+# 🧠 EXECUTION REFINEMENT
+# ==========================================================
+def refine_universe(hist):
+    """
+    Vectorized EMA50 / ATR14 sanity pass over the whole (ticker, field) frame at once.
+    Returns {symbol: (live_price, sl, tgt)} for setups that pass the trend check.
+    """
+    if hist.empty: return {}
+    close = hist.xs("Close", axis=1, level=1)
+    high  = hist.xs("High", axis=1, level=1)
+    low   = hist.xs("Low", axis=1, level=1)
+    tickers = close.columns
+    # fetch_history sorts columns, so the extra reindex copy is only a fallback
+    if not (high.columns.equals(tickers) and low.columns.equals(tickers)):
+        high, low = high.reindex(columns=tickers), low.reindex(columns=tickers)
+    c, h, l = (f.to_numpy(dtype=np.float64) for f in (close, high, low))
+
+    # Per-ticker bar validity (mirrors the old per-symbol dropna).
+    # np.where instead of in-place masking: to_numpy() may hand back read-only views.
+    invalid = np.isnan(c) | np.isnan(h) | np.isnan(l)
+    c, h, l = (np.where(invalid, np.nan, x) for x in (c, h, l))
+    valid = ~invalid
+
+    last = (len(c) - 1) - np.argmax(valid[::-1], axis=0)
+    live = c[last, np.arange(c.shape[1])]
+
+    # Cheap gates first: bar count + Trend Sanity Check (EMA50). Most names stop here.
+    ema50 = fast_ta.ema(c, 50)[-1]
+    with np.errstate(invalid="ignore"):
+        keep = np.flatnonzero((valid.sum(axis=0) >= MIN_BARS_REQUIRED) & (live >= ema50))
+    if not keep.size: return {}
+
+    # Wilder ATR14 only for the survivors (compiled kernels when numba is available)
+    atr  = fast_ta.atr(h[:, keep], l[:, keep], c[:, keep], 14)[-1]
+    live = live[keep]
+    sl   = np.round(live - 2.0 * atr, 1)
+    tgt  = np.round(live + 3.5 * atr, 1)
+
+    return {
+        tickers[j].removesuffix(".NS"): (float(live[k]), float(sl[k]), float(tgt[k]))
+        for k, j in enumerate(keep) if atr[k] > 0
+    }
 
 # ==========================================================
 # 🚀 MAIN EXECUTION
@@ -164,51 +364,38 @@ def main():
     symbols = [u["symbol"] for u in universe]
     print("⏳ Fetching Live Prices...")
     
-    tickers = [f"{s}.NS" for s in symbols]
-    hist = yf.download(tickers, period="1y", group_by="ticker", threads=True, progress=False)
+    hist = fetch_history(symbols)
     
+    try: refined = refine_universe(hist)
+    except Exception as e:
+        print(f"❌ Refinement Failed: {e}")
+        return
+
     executable_setups = []
     sheet_rows = []
+    today_str = ist_now().strftime("%Y-%m-%d") # Run-invariant: formatted once
 
     for u in universe:
         sym = u["symbol"]
-        
-        try:
-            # Safe Data Extraction
-            if isinstance(hist.columns, pd.MultiIndex):
-                if f"{sym}.NS" not in hist.columns.levels[0]: continue
-                df = hist[f"{sym}.NS"].copy()
-            else:
-                if len(symbols) == 1: df = hist.copy()
-                else: continue 
-
-            df = df.dropna()
-            if df.empty: continue
-            df.columns = [c.capitalize() for c in df.columns]
-
-            # Refine
-            refined = refine_trade(df)
-            if not refined: continue
-            
-            live_price, sl, tgt = refined
-
-            # Prepare Output
-            setup = {
-                "symbol": sym, "score": u["score"], "price": live_price,
-                "sl": sl, "tgt": tgt, "sector": u.get("sector", "Unknown"),
-                "protocol": protocol
-            }
-            executable_setups.append(setup)
-
-            # Prepare Sheet Row (With Run ID)
-            sheet_rows.append([
-                ist_now().strftime("%Y-%m-%d"), 
-                sym, u["score"], live_price, sl, tgt, 
-                u.get("sector", "Unknown"), u.get("del_pct", 0), 
-                protocol, run_id # <--- Strong Idempotency Key
-            ])
-
-        except Exception: continue
+        if sym not in refined: continue
+
+        live_price, sl, tgt = refined[sym]
+
+        # Prepare Output
+        setup = {
+            "symbol": sym, "score": u["score"], "price": live_price,
+            "sl": sl, "tgt": tgt, "sector": u.get("sector", "Unknown"),
+            "protocol": protocol
+        }
+        executable_setups.append(setup)
+
+        # Prepare Sheet Row (With Run ID)
+        sheet_rows.append([
+            today_str, 
+            sym, u["score"], live_price, sl, tgt, 
+            u.get("sector", "Unknown"), u.get("del_pct", 0), 
+            protocol, run_id # <--- Strong Idempotency Key
+        ])
 
     # ======================================================
     # 📢 REPORTING
@@ -217,31 +404,31 @@ def main():
         print("⚠️ No setups passed Live Refinement.")
         return
     
-    # [DEFENSIVE] Re-sort to ensure best setups survive refinement
-    executable_setups.sort(key=lambda x: x["score"], reverse=True)
+    # [DEFENSIVE] Re-rank to ensure best setups survive refinement (Top-K only)
+    top_setups = rank_by_score(executable_setups, max_display)
     
-    msg = [
-        f"💎 <b>Diamond v16.1 Execution</b>",
-        f"🆔 Run: <code>{run_id}</code>",
-        f"📅 {ist_now().strftime('%d-%b %H:%M')} | 🚦 {kill_switch}",
-        f"⚖️ Protocol: <b>{protocol}</b>",
-        ""
-    ]
+    # Single buffer, one write per line (no list + join pass)
+    buf = io.StringIO()
+    w = buf.write
+    w("💎 <b>Diamond v16.1 Execution</b>\n")
+    w(f"🆔 Run: <code>{run_id}</code>\n")
+    w(f"📅 {ist_now().strftime('%d-%b %H:%M')} | 🚦 {kill_switch}\n")
+    w(f"⚖️ Protocol: <b>{protocol}</b>\n\n")
 
     # Display Throttled List
-    for r in executable_setups[:max_display]:
+    for r in top_setups:
         icon = "🚀" if r["score"] > 85 else "✅"
-        msg.append(
+        w(
             f"{icon} <b>{r['symbol']}</b> ({r['score']})\n"
             f"   💰 ₹{r['price']} | 🏗️ {r['sector']}\n"
-            f"   🎯 {r['tgt']} | 🛑 {r['sl']}"
+            f"   🎯 {r['tgt']} | 🛑 {r['sl']}\n"
         )
     
     if len(executable_setups) > max_display:
-        msg.append(f"\n<i>...and {len(executable_setups) - max_display} more (Hidden by Protocol)</i>")
+        w(f"\n<i>...and {len(executable_setups) - max_display} more (Hidden by Protocol)</i>\n")
 
-    final_msg = "\n".join(msg)
-    print(final_msg.replace("<b>", "").replace("</b>", "").replace("<code>", "").replace("</code>", ""))
+    final_msg = buf.getvalue().rstrip("\n")
+    print(_TAG_RE.sub("", final_msg))
     send_msg(final_msg)
 
     # ======================================================
@@ -254,15 +441,25 @@ def main():
                 scopes=["https://www.googleapis.com/auth/spreadsheets"]
             )
             client = gspread.authorize(creds)
-            ws = client.open_by_key(GOOGLE_SHEET_ID).worksheet("history")
+            sheet = client.open_by_key(GOOGLE_SHEET_ID)
             
-            unique_rows = check_sheets_idempotency(sheet_rows, ws)
+            key_cache = load_sheets_keys()
+            unique_rows = check_sheets_idempotency(sheet_rows, sheet, key_cache)
             
             if unique_rows:
-                ws.append_rows(unique_rows)
+                # Single values.append call: no worksheet lookup, no pre-read
+                sheet.values_append(
+                    f"{HISTORY_TAB}!A:J",
+                    params={"valueInputOption": "RAW", "insertDataOption": "INSERT_ROWS"},
+                    body={"values": unique_rows}
+                )
+                # last_row stays put: the next delta read re-syncs these rows cheaply
+                key_cache["keys"].update((r[0], r[1], r[-1]) for r in unique_rows)
+                key_cache["dirty"] = True
                 print(f"✅ Pushed {len(unique_rows)} unique rows to Sheets (Run {run_id}).")
             else:
                 print("✅ No new rows to push (Duplicates skipped).")
+            save_sheets_keys(key_cache)
                 
         except Exception as e:
             print(f"⚠️ Sheets Error: {e}")
@@ -3,22 +3,39 @@
 # 🏆 STATUS: PRODUCTION | ATOMIC WRITES | RISK GOVERNANCE
 # ==========================================================
 
-import os, json, datetime, io, sys, random, math, csv
+import os, json, datetime, io, sys, random, math, csv, asyncio, heapq
 import requests, pytz
+import numpy as np
 import pandas as pd
-import pandas_ta as ta
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pacsv
 import yfinance as yf
-from statistics import median, stdev
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from requests.adapters import HTTPAdapter
 from urllib3.util.retry import Retry
 
+# Fast JSON (orjson when installed; stdlib fallback). Both work on bytes.
+try:
+    import orjson
+    _json_loads, _json_dumps = orjson.loads, orjson.dumps
+    def _json_dumps_pretty(obj): return orjson.dumps(obj, option=orjson.OPT_INDENT_2 | orjson.OPT_SERIALIZE_NUMPY)
+except ImportError:
+    _json_loads = json.loads
+    def _json_dumps(obj): return json.dumps(obj).encode()
+    def _json_dumps_pretty(obj): return json.dumps(obj, indent=2).encode()
+
+import fast_ta
+from fast_ta import njit
+
 # ==========================================================
 # ⚙️ CONFIGURATION
 # ==========================================================
 IST = pytz.timezone("Asia/Kolkata")
 
 # Files
-CACHE_FILE  = "diamond_data_cache.json"
+CACHE_FILE  = "diamond_data_cache.parquet" # <--- Fundamentals (symbol -> pe, de, sector)
+LEGACY_CACHE_FILE = "diamond_data_cache.json"  # <--- Pre-parquet cache, migrated on first load
 SIGNAL_FILE = "diamond_signal.json"       # <--- The Contract
 AUDIT_LOG   = "diamond_audit_trail.csv"   # <--- False Negatives
 REGIME_LOG  = "sector_regime_journal.csv" # <--- Market Memory
@@ -28,6 +45,17 @@ MIN_BARS_REQUIRED    = 100
 SCORE_THRESHOLD      = 75    # Strict Filter
 DISPERSION_THRESHOLD = 15    # Below this = Market is Choppy
 MIN_SECTOR_SIZE      = 5     # Minimum stocks to rank a sector
+FUND_CONCURRENCY     = 3     # Parallel fundamentals fetches (Yahoo ban-risk envelope)
+CHART_WORKERS        = 10    # Parallel Yahoo chart calls for the price history
+SYMBOL_BLOCK         = 32    # Symbols per indicator tile (keeps kernel working set in L2)
+
+CHART_URL = "https://query1.finance.yahoo.com/v8/finance/chart/{}"
+
+# yfinance field labels -> lowercase OHLC labels (static map, applied once per frame)
+_OHLC_RENAME = {
+    "Open": "open", "High": "high", "Low": "low", "Close": "close",
+    "Adj Close": "adj close", "Volume": "volume"
+}
 
 # Secrets
 TELEGRAM_TOKEN = os.getenv("TELEGRAM_TOKEN")
@@ -56,20 +84,29 @@ def is_trading_day(date_obj):
     if date_obj.strftime("%Y-%m-%d") in MARKET_HOLIDAYS: return False
     return True
 
-def create_session():
+def _new_session():
     s = requests.Session()
     retries = Retry(total=3, backoff_factor=1, status_forcelist=[500, 502, 503, 504])
-    s.mount('https://', HTTPAdapter(max_retries=retries))
-    s.headers.update({"User-Agent": random.choice(USER_AGENTS), "Referer": "https://www.nseindia.com/"})
+    # Pool sized for the chart thread pool; keep-alive is shared by NSE, Yahoo and Telegram
+    s.mount('https://', HTTPAdapter(pool_connections=32, pool_maxsize=32, max_retries=retries))
     return s
 
+# Site headers go per request: NSE wants browser UA + Referer, Yahoo only a browser UA
+_UA = random.choice(USER_AGENTS)
+NSE_HEADERS   = {"User-Agent": _UA, "Referer": "https://www.nseindia.com/"}
+YAHOO_HEADERS = {"User-Agent": _UA}
+
+SESSION = _new_session() # One per process: handshakes are paid once per host
+
+def create_session(): return SESSION
+
 def send_msg(text):
     if not TELEGRAM_TOKEN or not CHAT_ID: 
         print(f"\n📢 [Telegram]\n{text}\n")
         return
     try:
         url = f"https://api.telegram.org/bot{TELEGRAM_TOKEN}/sendMessage"
-        requests.post(url, data={"chat_id": CHAT_ID, "text": text[:4000], "parse_mode": "HTML"}, timeout=10)
+        SESSION.post(url, data={"chat_id": CHAT_ID, "text": text[:4000], "parse_mode": "HTML"}, timeout=10)
     except: pass
 
 # ==========================================================
@@ -87,12 +124,11 @@ def write_json_contract(metadata, candidates):
     # Atomic Write: Write to temp -> Rename
     temp_file = f"{SIGNAL_FILE}.tmp"
     try:
-        with open(temp_file, "w") as f:
-            json.dump(contract, f, indent=4)
+        with open(temp_file, "wb") as f:
+            f.write(_json_dumps_pretty(contract))
         
-        # Windows requires removal before rename, Linux doesn't, but safe to handle
-        if os.path.exists(SIGNAL_FILE): os.remove(SIGNAL_FILE)
-        os.rename(temp_file, SIGNAL_FILE)
+        # os.replace overwrites in one step on both Windows and Linux
+        os.replace(temp_file, SIGNAL_FILE)
         
         print(f"✅ JSON Contract Generated (Atomic): {SIGNAL_FILE}")
     except Exception as e:
@@ -101,13 +137,11 @@ def write_json_contract(metadata, candidates):
 def log_audit_trail(rejected_list):
     """Logs WHY stocks were rejected (False Negative Analysis)."""
     file_exists = os.path.exists(AUDIT_LOG)
-    with open(AUDIT_LOG, "a", newline="") as f:
-        writer = csv.writer(f)
-        if not file_exists: writer.writerow(["Timestamp", "Symbol", "Score", "Reason", "Sector"])
-        
-        now = ist_now().strftime("%Y-%m-%d %H:%M")
-        for r in rejected_list:
-            writer.writerow([now, r['symbol'], r['score'], r['reason'], r['sector']])
+    df = pd.DataFrame(rejected_list, columns=["symbol", "score", "reason", "sector"])
+    df.insert(0, "timestamp", ist_now().strftime("%Y-%m-%d %H:%M"))
+    df.columns = ["Timestamp", "Symbol", "Score", "Reason", "Sector"]
+    # One batched append instead of a writerow per rejection
+    df.to_csv(AUDIT_LOG, mode="a", header=not file_exists, index=False, lineterminator="\r\n")
     print(f"✅ Audit Trail Updated: {len(rejected_list)} rejections logged.")
 
 def log_sector_regime(sector_map, dispersion):
@@ -135,14 +169,18 @@ def fetch_nifty_trend():
         if isinstance(hist.columns, pd.MultiIndex):
             try: hist = hist.xs('^NSEI', axis=1, level=1)
             except: hist.columns = hist.columns.get_level_values(0)
-        hist.columns = [c.lower() for c in hist.columns]
-        close = hist['close']
-        ema50 = ta.ema(close, length=50).iloc[-1]
-        curr = close.iloc[-1]
+        hist = hist.rename(columns=_OHLC_RENAME)
+        close = hist['close'].dropna().to_numpy(dtype=float)
+        ema50 = fast_ta.ema(close, 50)[-1, 0]
+        curr, ref = close[-1], close[-10]
         trend = "BULL" if curr > ema50 * 1.01 else "BEAR" if curr < ema50 * 0.99 else "NEUTRAL"
-        return trend, float((curr - close.iloc[-10]) / close.iloc[-10])
+        return trend, float((curr - ref) / ref)
     except: return "NEUTRAL", 0.0
 
+def _trimmed(col):
+    """Bhavdata pads text fields with spaces (' EQ'); numeric columns pass through."""
+    return pc.utf8_trim_whitespace(col) if pa.types.is_string(col.type) else col
+
 def fetch_delivery_data():
     session = create_session()
     for i in range(3):
@@ -150,111 +188,291 @@ def fetch_delivery_data():
         if not is_trading_day(d): continue
         url = f"https://archives.nseindia.com/products/content/sec_bhavdata_full_{d.strftime('%d%m%Y')}.csv"
         try:
-            r = session.get(url, timeout=10)
+            r = session.get(url, headers=NSE_HEADERS, timeout=10)
             if r.status_code == 200:
-                df = pd.read_csv(io.StringIO(r.text))
-                df.columns = [c.strip().upper() for c in df.columns]
-                df = df[df["SERIES"] == "EQ"]
-                return dict(zip(df['SYMBOL'], pd.to_numeric(df['DELIV_PER'], errors='coerce')))
+                # Arrow CSV reader on the raw bytes; filter EQ rows before leaving Arrow
+                table = pacsv.read_csv(io.BytesIO(r.content))
+                table = table.rename_columns([c.strip().upper() for c in table.column_names])
+                table = table.filter(pc.equal(_trimmed(table["SERIES"]), "EQ"))
+                deliv = pd.to_numeric(_trimmed(table["DELIV_PER"]).to_pandas(), errors='coerce')
+                return dict(zip(_trimmed(table["SYMBOL"]).to_pylist(), deliv.to_numpy()))
         except: continue
     return {}
 
-def update_fundamentals(symbols):
-    cache = {}
+def fetch_chart(session, ticker):
+    """1y of daily OHLCV for one ticker from Yahoo's chart endpoint (yfinance field names)."""
+    r = session.get(CHART_URL.format(ticker), params={"range": "1y", "interval": "1d"},
+                    headers=YAHOO_HEADERS, timeout=10)
+    r.raise_for_status()
+    res = r.json()["chart"]["result"][0]
+    quote = res["indicators"]["quote"][0]
+    dates = pd.to_datetime(res["timestamp"], unit="s").normalize()
+    df = pd.DataFrame(
+        {f: quote[f.lower()] for f in ("Open", "High", "Low", "Close", "Volume")},
+        index=dates, dtype=float
+    )
+    # Intraday, today's bar can come back twice (closed row + live row); keep the latest
+    return df[~df.index.duplicated(keep="last")]
+
+def fetch_history(symbols):
+    """
+    1y daily bars as a (ticker, field) frame, same layout as yf.download(group_by='ticker').
+    Chart calls fan out over a thread pool; yf.download covers any ticker that fails.
+    """
+    tickers = [f"{s}.NS" for s in symbols]
+    session = create_session()
+    frames = {}
+    with ThreadPoolExecutor(max_workers=CHART_WORKERS) as pool:
+        futures = {pool.submit(fetch_chart, session, tk): tk for tk in tickers}
+        for fut in as_completed(futures):
+            try: frames[futures[fut]] = fut.result()
+            except Exception: continue
+
+    missing = [tk for tk in tickers if tk not in frames]
+    if missing:
+        print(f"⚠️ Chart API missed {len(missing)} tickers. Falling back to yf.download...")
+        try:
+            fb = yf.download(missing, period="1y", group_by='ticker', progress=False, threads=True)
+            if not isinstance(fb.columns, pd.MultiIndex) and len(missing) == 1 and not fb.empty:
+                fb = pd.concat({missing[0]: fb}, axis=1)
+            if isinstance(fb.columns, pd.MultiIndex):
+                if fb.index.tz is not None: fb.index = fb.index.tz_localize(None)
+                frames.update({tk: fb[tk] for tk in fb.columns.get_level_values(0).unique()})
+        except Exception as e: print(f"❌ Fallback download failed: {e}")
+
+    # Fixed ticker order keeps downstream iteration deterministic
+    return pd.concat({tk: frames[tk] for tk in tickers if tk in frames}, axis=1) if frames else pd.DataFrame()
+
+def fetch_fundamental(symbol):
+    """Blocking .info call; yfinance owns the Yahoo cookie/crumb handshake."""
+    info = yf.Ticker(f"{symbol}.NS").info
+    return {
+        "pe": info.get("trailingPE", 0),
+        "de": info.get("debtToEquity", 0),
+        "sector": info.get("sector", "Unknown")
+    }
+
+async def _fetch_fundamental_async(symbol, sem):
+    async with sem:
+        try: data = await asyncio.to_thread(fetch_fundamental, symbol)
+        except Exception: data = None
+        await asyncio.sleep(random.uniform(0.5, 1.5)) # Jitter: hold the slot (ban safety)
+        return symbol, data
+
+async def _fetch_fundamentals_async(symbols):
+    sem = asyncio.Semaphore(FUND_CONCURRENCY)
+    return await asyncio.gather(*(_fetch_fundamental_async(s, sem) for s in symbols))
+
+def load_fundamentals_cache():
+    """Columnar cache (symbol-indexed pe/de/sector) -> {symbol: {pe, de, sector}}."""
     if os.path.exists(CACHE_FILE):
+        try: return pd.read_parquet(CACHE_FILE).to_dict("index")
+        except Exception as e: print(f"⚠️ Fundamentals Cache Unreadable: {e}. Rebuilding.")
+    elif os.path.exists(LEGACY_CACHE_FILE):
         try:
-            with open(CACHE_FILE, 'r') as f: cache = json.load(f)
+            with open(LEGACY_CACHE_FILE, 'rb') as f: return _json_loads(f.read())
         except: pass
+    return {}
+
+def save_fundamentals_cache(cache):
+    """Symbol-indexed pe/de/sector table, zstd parquet, written atomically."""
+    df = pd.DataFrame.from_dict(cache, orient="index")
+    df.index.name = "symbol"
+    # Yahoo occasionally returns non-numeric ratios ("Infinity"); keep columns typed
+    for col in ("pe", "de"): df[col] = pd.to_numeric(df[col], errors="coerce")
+    df["sector"] = df["sector"].fillna("Unknown").astype(str)
+
+    # Atomic Write: temp -> replace (Crash-Safe)
+    temp_file = f"{CACHE_FILE}.tmp"
+    try:
+        df.to_parquet(temp_file, engine="pyarrow", compression="zstd")
+        os.replace(temp_file, CACHE_FILE)
+    except Exception as e:
+        print(f"⚠️ Fundamentals Cache Write Failed: {e}")
+
+def update_fundamentals(symbols):
+    cache = load_fundamentals_cache()
+    # Cache came from the legacy JSON: migrate to parquet even if nothing needs fetching
+    migrate = bool(cache) and not os.path.exists(CACHE_FILE)
     
     need_update = [s for s in symbols if s not in cache]
     if need_update:
-        print(f"📊 Updating fundamentals for {len(need_update)} stocks...")
-        chunk_size = 50
-        for i in range(0, len(need_update), chunk_size):
-            chunk = need_update[i:i+chunk_size]
-            try:
-                tickers = yf.Tickers(" ".join([f"{s}.NS" for s in chunk]))
-                for s in chunk:
-                    info = tickers.tickers[f"{s}.NS"].info
-                    cache[s] = {
-                        "pe": info.get("trailingPE", 0),
-                        "de": info.get("debtToEquity", 0),
-                        "sector": info.get("sector", "Unknown")
-                    }
-            except: pass
-        with open(CACHE_FILE, 'w') as f: json.dump(cache, f)
+        print(f"📊 Updating fundamentals for {len(need_update)} stocks ({FUND_CONCURRENCY} concurrent)...")
+        for sym, data in asyncio.run(_fetch_fundamentals_async(need_update)):
+            if data: cache[sym] = data # Failures retry next run
+    if cache and (need_update or migrate): save_fundamentals_cache(cache)
     return cache
 
 def calculate_sector_metrics(stock_data):
     """Computes Scores AND Dispersion with Robustness checks."""
-    sector_perf = {}
-    for item in stock_data:
-        sec = item.get('sector', 'Unknown')
-        sector_perf.setdefault(sec, []).append(item.get('perf_10d', 0.0))
+    if not stock_data: return {}, 0.0
+    df = pd.DataFrame(stock_data, columns=["sector", "perf_10d"])
+    df["sector"] = df["sector"].fillna("Unknown")
+
+    # One grouped pass: per-sector median 10d performance + breadth
+    agg = df.groupby("sector")["perf_10d"].agg(["median", "size"])
     
     # POLISH 1: Increase minimum breadth to 5
-    medians = {k: median(v) for k, v in sector_perf.items() if len(v) >= MIN_SECTOR_SIZE}
+    agg = agg[agg["size"] >= MIN_SECTOR_SIZE]
     
-    if not medians: return {}, 0.0 # Handle case where no sector has enough breadth
+    if agg.empty: return {}, 0.0 # Handle case where no sector has enough breadth
     
-    sorted_secs = sorted(medians.items(), key=lambda x: x[1], reverse=True)
-    
-    scores = {}
-    for i, (sec, _) in enumerate(sorted_secs):
-        scores[sec] = int((1 - (i / max(len(sorted_secs), 1))) * 100)
+    # Linear rank score (leader = 100) straight from the rank of each median
+    medians = agg["median"].to_numpy()
+    n = len(medians)
+    ranks = np.argsort(-medians, kind="stable").argsort()
+    vals = ((1 - ranks / n) * 100).astype(int)
+    scores = dict(zip(agg.index, vals.tolist()))
         
-    vals = list(scores.values())
-    dispersion = stdev(vals) if len(vals) > 1 else 0
+    dispersion = float(vals.std(ddof=1)) if n > 1 else 0
         
     return scores, dispersion
 
-def calculate_score(df, symbol, avg_delivery, sector_map, nifty_perf, fund):
-    if len(df) < MIN_BARS_REQUIRED: return None
-    close, high, low = df["close"], df["high"], df["low"]
-    price = float(close.iloc[-1])
-    
-    try:
-        rsi = ta.rsi(close, 14).iloc[-1]
-        ema20, ema50, ema200 = ta.ema(close, 20).iloc[-1], ta.ema(close, 50).iloc[-1], ta.ema(close, 200).iloc[-1]
-        atr = ta.atr(high, low, close, 14).iloc[-1]
-        volatility = atr / price 
-    except: return None
-
-    # 1. Technical (25%)
-    if price > ema20 > ema50 > ema200: t = 100 if 55 <= rsi <= 70 else 90
-    elif price > ema50: t = 60
-    else: t = 20
-
-    # 2. Delivery (20%)
-    d = min(100, int((avg_delivery.get(symbol, 30.0) / 60) * 100))
-
-    # 3. Sector (15%)
-    s = sector_map.get(fund.get('sector', 'Unknown'), 50)
-
-    # 4. Alpha (15%)
-    alpha_bps = ((price - close.iloc[-10]) / close.iloc[-10] - nifty_perf) * 10000
-    a = 100 if alpha_bps > 300 else 80 if alpha_bps > 100 else 60 if alpha_bps > 0 else 30
-
-    # 5. Fundamental (10%)
-    pe = fund.get('pe', 0)
-    f = 100 if 0 < pe < 30 else 70 if pe < 60 else 40
-
-    # 6. Solvency (10%)
-    de = fund.get('de', 0)
-    solv = 100 if de <= 50 else 70 if de <= 150 else 30
-
-    # 7. Beta (5%)
-    b = 100 if volatility < 0.02 else 70 if volatility < 0.04 else 40
+def build_universe(hist_data, symbols, fund_cache):
+    """
+    Struct-of-arrays view of the batch, built once from the (ticker, field) frame:
+    (T, N) float32 close/high/low arrays for the indicator kernels, float64 last
+    price / perf_10d for reporting, and a symbol-aligned `funds` frame.
+    A bar missing any OHLCV field is blanked for that symbol (same as the old per-frame dropna).
+    """
+    if not isinstance(hist_data.columns, pd.MultiIndex): return None
+    hist_data = hist_data.rename(columns=_OHLC_RENAME, level=1)
+    present = set(hist_data.columns.get_level_values(0))
+    tickers = [f"{s}.NS" for s in symbols if f"{s}.NS" in present]
+    if not tickers: return None
+
+    # OHLCV only: 'adj close' exists on fallback frames alone (all-NaN for chart tickers)
+    have = set(hist_data.columns.get_level_values(1))
+    fields = {f: hist_data.xs(f, axis=1, level=1).reindex(columns=tickers).to_numpy(dtype=float)
+              for f in ("open", "high", "low", "close", "volume") if f in have}
+    gap = np.logical_or.reduce([np.isnan(x) for x in fields.values()])
+    close, high, low = (np.where(gap, np.nan, fields[f]) for f in ("close", "high", "low"))
+
+    keep = (~np.isnan(close)).sum(axis=0) >= 20
+    syms = [tk[:-3] for tk, k in zip(tickers, keep) if k]
+    close, high, low = close[:, keep], high[:, keep], low[:, keep]
+    price, ref_10 = fast_ta.nth_last_valid(close, 1), fast_ta.nth_last_valid(close, 10)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        perf_10d = (price - ref_10) / ref_10
+
+    # Indicator inputs in float32: score thresholds are coarse, the sweeps are bandwidth-bound
+    close, high, low = (x.astype(np.float32) for x in (close, high, low))
+    return {
+        "symbols": syms, "close": close, "high": high, "low": low,
+        "price": price, "perf_10d": perf_10d,
+        "funds": pd.DataFrame([{"pe": 0, "de": 0, "sector": "Unknown", **fund_cache.get(s, {})} for s in syms],
+                              index=syms, columns=["pe", "de", "sector"])
+    }
 
-    final = (t*0.25) + (d*0.20) + (s*0.15) + (a*0.15) + (f*0.10) + (solv*0.10) + (b*0.05)
-    
+def _block_features(close, high, low):
+    """Tail-value features for one symbol block (C-contiguous, rows = bars)."""
+    ema20, ema50, ema200 = (fast_ta.ema(close, n)[-1] for n in (20, 50, 200))
     return {
-        "symbol": symbol, "score": int(final), "price": price,
-        "tgt": round(price + 3.5*atr, 1), "sl": round(price - 2.0*atr, 1),
-        "del_pct": round(avg_delivery.get(symbol, 30.0), 1), "sector": fund.get('sector', 'Unknown'),
-        "perf_10d": (price - close.iloc[-10]) / close.iloc[-10]
+        "bars": (~np.isnan(close)).sum(axis=0),
+        "rsi": fast_ta.rsi(close, 14)[-1],
+        "ema20": ema20, "ema50": ema50, "ema200": ema200,
+        "atr": fast_ta.atr(high, low, close, 14)[-1]
     }
 
+def compute_features(uni):
+    """
+    Indicator tail values for every symbol in one vectorized pass.
+    Returns {feature: array aligned to uni["symbols"]}.
+    The symbol axis is swept in SYMBOL_BLOCK-wide tiles so each kernel's
+    working set (and its temporaries) stays cache-resident.
+    """
+    close, high, low = uni["close"], uni["high"], uni["low"]
+    blocks = [
+        _block_features(*(np.ascontiguousarray(x[:, j:j + SYMBOL_BLOCK]) for x in (close, high, low)))
+        for j in range(0, close.shape[1], SYMBOL_BLOCK)
+    ]
+    return {k: np.concatenate([blk[k] for blk in blocks]) for k in blocks[0]}
+
+@njit(cache=True)
+def score_all(rsi, ema20, ema50, ema200, price, atr, deliv, sector_sc, perf_10d, nifty_perf, pe, de):
+    """7-factor weighted score per symbol: the threshold ladders as one scalar pass."""
+    N = price.shape[0]
+    out = np.empty(N, dtype=np.int64)
+    for i in range(N):
+        # 1. Technical (25%)
+        stacked = price[i] > ema20[i] and ema20[i] > ema50[i] and ema50[i] > ema200[i]
+        if stacked and rsi[i] >= 55 and rsi[i] <= 70: t = 100
+        elif stacked: t = 90
+        elif price[i] > ema50[i]: t = 60
+        else: t = 20
+
+        # 2. Delivery (20%)
+        d = min(100.0, math.trunc((deliv[i] / 60) * 100))
+
+        # 4. Alpha (15%)
+        alpha_bps = (perf_10d[i] - nifty_perf) * 10000
+        if alpha_bps > 300: a = 100
+        elif alpha_bps > 100: a = 80
+        elif alpha_bps > 0: a = 60
+        else: a = 30
+
+        # 5. Fundamental (10%)
+        if pe[i] > 0 and pe[i] < 30: f = 100
+        elif pe[i] < 60: f = 70
+        else: f = 40
+
+        # 6. Solvency (10%)
+        if de[i] <= 50: solv = 100
+        elif de[i] <= 150: solv = 70
+        else: solv = 30
+
+        # 7. Beta (5%)
+        volatility = atr[i] / price[i]
+        if volatility < 0.02: b = 100
+        elif volatility < 0.04: b = 70
+        else: b = 40
+
+        # 3. Sector (15%) is precomputed per symbol
+        final = (t*0.25) + (d*0.20) + (sector_sc[i]*0.15) + (a*0.15) + (f*0.10) + (solv*0.10) + (b*0.05)
+        out[i] = int(final)
+    return out
+
+def score_from_features(uni, feat, avg_delivery, sector_map, nifty_perf):
+    """
+    7-factor score from precomputed features only (no OHLC frames);
+    the threshold ladders run in the score_all kernel.
+    Classifies in the same pass: returns (candidates, rejected).
+    """
+    # EMA200 needs 200 bars; names short of that were skipped before and still are
+    keep = np.flatnonzero((feat["bars"] >= MIN_BARS_REQUIRED) & ~np.isnan(feat["ema200"]))
+    if not keep.size: return [], []
+
+    symbols = [uni["symbols"][i] for i in keep]
+    funds   = uni["funds"].iloc[keep]
+    rsi, ema20, ema50, ema200, atr = (
+        feat[k][keep].astype(float) for k in ("rsi", "ema20", "ema50", "ema200", "atr")
+    )
+    price    = uni["price"][keep]    # float64 quote for tgt/sl and the report
+    perf_10d = uni["perf_10d"][keep] # From the universe build; not re-derived here
+
+    deliv  = np.array([avg_delivery.get(sym, 30.0) for sym in symbols], dtype=float)
+    deliv  = np.where(np.isnan(deliv), 30.0, deliv) # '-' in bhavdata -> default
+    sector = funds["sector"].tolist()
+    sector_sc = np.array([sector_map.get(sec, 50) for sec in sector], dtype=float)
+    pe     = pd.to_numeric(funds["pe"], errors='coerce').to_numpy(dtype=float)
+    de     = pd.to_numeric(funds["de"], errors='coerce').to_numpy(dtype=float)
+
+    score = score_all(rsi, ema20, ema50, ema200, price, atr, deliv, sector_sc, perf_10d, float(nifty_perf), pe, de)
+
+    candidates, rejected = [], []
+    for i, sym in enumerate(symbols):
+        sc = int(score[i])
+        if sc > SCORE_THRESHOLD:
+            candidates.append({
+                "symbol": sym, "score": sc, "price": float(price[i]),
+                "tgt": round(float(price[i] + 3.5*atr[i]), 1), "sl": round(float(price[i] - 2.0*atr[i]), 1),
+                "del_pct": round(float(deliv[i]), 1), "sector": sector[i],
+                "perf_10d": float(perf_10d[i])
+            })
+        else:
+            rejected.append({"symbol": sym, "score": sc, "reason": "Score Too Low", "sector": sector[i]})
+    return candidates, rejected
+
 # ==========================================================
 # 🚀 MAIN EXECUTION
 # ==========================================================
@@ -265,34 +483,23 @@ def main():
     # Load Universe
     try:
         url = "https://archives.nseindia.com/content/indices/ind_nifty200list.csv"
-        symbols = pd.read_csv(io.StringIO(create_session().get(url).text))["Symbol"].tolist()
+        symbols = pd.read_csv(io.StringIO(create_session().get(url, headers=NSE_HEADERS).text))["Symbol"].tolist()
     except: symbols = ["RELIANCE", "HDFCBANK", "INFY", "TCS", "ICICIBANK"]
 
     # Data Fetch
     delivery_map = fetch_delivery_data()
     fund_cache = update_fundamentals(symbols)
-    hist_data = yf.download([f"{s}.NS" for s in symbols], period="1y", group_by='ticker', progress=True, threads=True)
+    hist_data = fetch_history(symbols)
     
-    # Pass 1: Pre-process
-    batch = []
+    # Pass 1: Pre-process (one SoA build; every later pass indexes by symbol column)
     print("\n🧠 Computing Metrics...")
-    for sym in symbols:
-        try:
-            df = hist_data[f"{sym}.NS"] if isinstance(hist_data.columns, pd.MultiIndex) else hist_data
-            df = df.dropna()
-            df.columns = [c.lower() for c in df.columns]
-            if len(df) < 20: continue
-            
-            f_data = fund_cache.get(sym, {})
-            batch.append({
-                "symbol": sym, "df": df, "fund": f_data,
-                "perf_10d": (df['close'].iloc[-1] - df['close'].iloc[-10]) / df['close'].iloc[-10],
-                "sector": f_data.get('sector', 'Unknown')
-            })
-        except: continue
+    uni = build_universe(hist_data, symbols, fund_cache)
+    features = compute_features(uni) if uni and uni["symbols"] else {}
 
     # Pass 2: Governance (Sector Dispersion)
-    sector_map, dispersion = calculate_sector_metrics(batch)
+    sector_map, dispersion = calculate_sector_metrics(
+        list(zip(uni["funds"]["sector"], uni["perf_10d"])) if features else []
+    )
     log_sector_regime(sector_map, dispersion)
     
     # Kill Switch Logic
@@ -304,23 +511,14 @@ def main():
     print(f"🚦 Market Status: {market_status} | Dispersion: {round(dispersion, 2)}")
     print(f"⚖️ Strategy Protocol: {sizing_rec}")
 
-    # Pass 3: Scoring & Audit
-    candidates, rejected = [], []
+    # Pass 3: Scoring & Audit (score + classify in one walk over the universe)
     print("💎 Ranking Stocks...")
-    
-    for item in batch:
-        res = calculate_score(item['df'], item['symbol'], delivery_map, sector_map, nifty_alpha, item['fund'])
-        if not res: continue
-        
-        if res["score"] > SCORE_THRESHOLD:
-            candidates.append(res)
-        else:
-            rejected.append({
-                "symbol": item["symbol"], "score": res["score"], 
-                "reason": "Score Too Low", "sector": item["sector"]
-            })
+    candidates, rejected = (
+        score_from_features(uni, features, delivery_map, sector_map, nifty_alpha) if features else ([], [])
+    )
 
-    candidates.sort(key=lambda x: x["score"], reverse=True)
+    # Top-k only (same order as a stable descending sort)
+    top = heapq.nlargest(20, candidates, key=lambda x: x["score"])
     
     # Governance Outputs
     log_audit_trail(rejected)
@@ -330,16 +528,15 @@ def main():
         "dispersion": dispersion, 
         "kill_switch": kill_switch_active,
         "recommendation": sizing_rec
-    }, candidates[:20])
+    }, top)
 
     # User Output
-    if candidates:
-        top = candidates[:15]
+    if top:
         report = [f"💎 <b>Diamond v17.1</b>\n📅 {ist_now().strftime('%d-%b')} | 🌍 {trend} | 🚦 {market_status}"]
         if kill_switch_active:
             report.append(f"\n⚠️ <b>RISK ALERT:</b> Dispersion Low ({round(dispersion,1)}). <b>{sizing_rec}</b>.")
             
-        for p in top:
+        for p in top[:15]:
             icon = "🚀" if p['score'] > 85 else "🟢"
             report.append(f"{icon} <b>{p['symbol']}</b> ({p['score']}) | 🏗️ {p['sector']}\n"
                           f"   💰 ₹{p['price']} | 🎯 {p['tgt']}")
@@ -0,0 +1,92 @@
+# ==========================================================
+# ⚡ FAST TA — ARRAY-NATIVE INDICATOR KERNELS
+# 🏆 STATUS: SHARED (v16 / v17) | NUMBA OPTIONAL
+# ==========================================================
+# All kernels take (T, N) float arrays: rows = bars, columns = symbols.
+# Conventions match pandas_ta / TA-Lib: EMA and Wilder smoothing are
+# seeded with the SMA of the first `n` valid bars, NaN before that.
+# NaN bars (holidays, missing data) carry the previous value forward.
+# float32 input stays float32 end to end (half the bytes per sweep);
+# anything else is computed in float64.
+
+import numpy as np
+
+try:
+    from numba import njit
+except ImportError:
+    # Fallback: same kernels run as row-wise NumPy (vectorized across symbols)
+    def njit(*args, **kwargs):
+        if args and callable(args[0]): return args[0]
+        return lambda fn: fn
+
+# ==========================================================
+# 🧮 CORE RECURRENCE
+# ==========================================================
+@njit(cache=True)
+def _smooth(x, alpha, n):
+    """SMA-seeded recursive smoothing down axis 0: y = alpha*x + (1-alpha)*y_prev."""
+    T, N = x.shape
+    out = np.full_like(x, np.nan)
+    seed_row = np.full(N, T, dtype=np.int64)
+
+    for j in range(N):
+        valid = np.flatnonzero(~np.isnan(x[:, j]))
+        if valid.size >= n:
+            seed_row[j] = valid[n - 1]
+            out[valid[n - 1], j] = x[valid[:n], j].mean()
+
+    for i in range(1, T):
+        prev, cur = out[i - 1], x[i]
+        step = np.where(np.isnan(cur), prev, alpha * cur + (1.0 - alpha) * prev)
+        out[i] = np.where(i > seed_row, step, out[i])
+    return out
+
+def _as_2d(x):
+    x = np.asarray(x)
+    x = x if x.dtype == np.float32 else x.astype(np.float64, copy=False)
+    return x.reshape(-1, 1) if x.ndim == 1 else x
+
+def _prev(x):
+    prev = np.empty_like(x)
+    prev[0] = np.nan
+    prev[1:] = x[:-1]
+    return prev
+
+# ==========================================================
+# 📈 INDICATORS
+# ==========================================================
+def ema(close, n):
+    return _smooth(_as_2d(close), 2.0 / (n + 1), n)
+
+def rma(x, n):
+    """Wilder's moving average (alpha = 1/n)."""
+    return _smooth(_as_2d(x), 1.0 / n, n)
+
+def true_range(high, low, close):
+    high, low, close = _as_2d(high), _as_2d(low), _as_2d(close)
+    prev_close = _prev(close)
+    tr = np.fmax(high - low, np.fmax(np.abs(high - prev_close), np.abs(low - prev_close)))
+    tr[np.isnan(prev_close)] = np.nan # TR undefined without a prior close
+    return tr
+
+def atr(high, low, close, n=14):
+    return rma(true_range(high, low, close), n)
+
+def rsi(close, n=14):
+    close = _as_2d(close)
+    diff = close - _prev(close)
+    avg_gain = rma(np.clip(diff, 0, None), n)
+    avg_loss = rma(np.clip(-diff, 0, None), n)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return 100.0 * avg_gain / (avg_gain + avg_loss)
+
+# ==========================================================
+# 🔎 TAIL ACCESS
+# ==========================================================
+def nth_last_valid(x, n=1):
+    """Per column: the n-th most recent non-NaN value (n=1 -> last), NaN if too short."""
+    x = _as_2d(x)
+    valid = ~np.isnan(x[::-1])
+    hit = valid & (valid.cumsum(axis=0) == n)
+    idx = len(x) - 1 - np.argmax(hit, axis=0)
+    return np.where(hit.any(axis=0), x[idx, np.arange(x.shape[1])], np.nan)